@@ -2,19 +2,23 @@ import io
 import re
 import unicodedata
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Tuple, Optional
+from itertools import islice
+from typing import List, Tuple, Optional, Sequence
 
 import streamlit as st
 from zoneinfo import ZoneInfo
 
+from reportlab import rl_config
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
 
-from PIL import Image, ImageOps
+from PIL import ExifTags, Image, ImageOps
 from xml.sax.saxutils import escape
 
 
@@ -22,6 +26,10 @@ from xml.sax.saxutils import escape
 # Config
 # -----------------------------
 st.set_page_config(page_title="jcamp029.pro", page_icon="🧾", layout="centered")
+# JPEG embebido tal cual (DCTDecode) y no re-codificado en ASCII85: -25% de tamaño
+# y sin el encoder ASCII85 en Python puro cuando falta rl_accel.
+rl_config.useA85 = 0
+
 APP_TITLE = "jcamp029.pro"
 APP_SUBTITLE = "Generador profesional de informes de inspección técnica (PDF)."
 TZ_CL = ZoneInfo("America/Santiago")
@@ -36,6 +44,7 @@ TOTAL_IMG_H_MM = 60
 # - Firma fija 3x3 cm
 SIGN_W_MM = 30
 SIGN_H_MM = 30
+SIGN_JPEG_QUALITY = 75
 
 
 # -----------------------------
@@ -69,32 +78,70 @@ FIELD_KEYS = {
 }
 
 
-def get_defaults() -> dict:
-    return {
-        FIELD_KEYS["theme"]: "Claro",
-        FIELD_KEYS["theme_initialized"]: False,
+# Campos del informe -> key de session_state (lo que recibe build_pdf)
+PDF_FIELD_KEYS = {
+    "titulo": FIELD_KEYS["titulo"],
+    "fecha": FIELD_KEYS["fecha"],
+    "disciplina": FIELD_KEYS["disciplina"],
+    "equipo": FIELD_KEYS["equipo"],
+    "ubicacion": FIELD_KEYS["ubicacion"],
+    "inspector": FIELD_KEYS["inspector"],
+    "cargo": FIELD_KEYS["cargo"],
+    "registro_ot": FIELD_KEYS["registro_ot"],
+    "nivel_riesgo": FIELD_KEYS["nivel_riesgo"],
+    "observaciones": FIELD_KEYS["observaciones_raw"],
+    "conclusion": FIELD_KEYS["conclusion"],
+}
+
+
+@dataclass(frozen=True, slots=True)
+class FormState:
+    """Snapshot inmutable de los campos del informe (entrada de build_pdf)."""
+    titulo: str
+    fecha: str
+    disciplina: str
+    equipo: str
+    ubicacion: str
+    inspector: str
+    cargo: str
+    registro_ot: str
+    nivel_riesgo: str
+    observaciones: str
+    conclusion: str
+
+
+_STATIC_DEFAULTS = {
+    FIELD_KEYS["theme"]: "Claro",
+    FIELD_KEYS["theme_initialized"]: False,
+
+    FIELD_KEYS["include_signature"]: True,
+    FIELD_KEYS["include_photos"]: True,
+    FIELD_KEYS["show_correccion"]: True,
+    FIELD_KEYS["auto_conclusion"]: True,
+
+    FIELD_KEYS["titulo"]: "Informe Técnico de Inspección",
+    FIELD_KEYS["disciplina"]: "Eléctrica",
+    FIELD_KEYS["equipo"]: "",
+    FIELD_KEYS["ubicacion"]: "",
+    FIELD_KEYS["inspector"]: "JORGE CAMPOS AGUIRRE",
+    FIELD_KEYS["cargo"]: "Especialista eléctrico",
+    FIELD_KEYS["registro_ot"]: "",
+    FIELD_KEYS["nivel_riesgo"]: "Medio",
+    FIELD_KEYS["observaciones_raw"]: "",
+    FIELD_KEYS["obs_fixed_preview"]: "",
+    FIELD_KEYS["conclusion"]: "",
+
+    FIELD_KEYS["conclusion_locked"]: False,
+    FIELD_KEYS["last_auto_hash"]: None,
+}
 
-        FIELD_KEYS["include_signature"]: True,
-        FIELD_KEYS["include_photos"]: True,
-        FIELD_KEYS["show_correccion"]: True,
-        FIELD_KEYS["auto_conclusion"]: True,
 
+def get_defaults() -> dict:
+    # Solo la fecha (y la lista mutable) se calculan por llamada.
+    return {
+        **_STATIC_DEFAULTS,
         FIELD_KEYS["fecha"]: datetime.now(TZ_CL).strftime("%d-%m-%Y"),
-        FIELD_KEYS["titulo"]: "Informe Técnico de Inspección",
-        FIELD_KEYS["disciplina"]: "Eléctrica",
-        FIELD_KEYS["equipo"]: "",
-        FIELD_KEYS["ubicacion"]: "",
-        FIELD_KEYS["inspector"]: "JORGE CAMPOS AGUIRRE",
-        FIELD_KEYS["cargo"]: "Especialista eléctrico",
-        FIELD_KEYS["registro_ot"]: "",
-        FIELD_KEYS["nivel_riesgo"]: "Medio",
         FIELD_KEYS["hallazgos"]: [],
-        FIELD_KEYS["observaciones_raw"]: "",
-        FIELD_KEYS["obs_fixed_preview"]: "",
-        FIELD_KEYS["conclusion"]: "",
-
-        FIELD_KEYS["conclusion_locked"]: False,
-        FIELD_KEYS["last_auto_hash"]: "",
     }
 
 
@@ -102,17 +149,19 @@ def init_state():
     if UP_NONCE not in st.session_state:
         st.session_state[UP_NONCE] = 0
 
-    defaults = get_defaults()
-
     # ✅ abrir siempre en CLARO al inicio de la sesión,
     # pero permitir cambiar a Oscuro después (no se pisa en reruns).
     if not st.session_state.get(FIELD_KEYS["theme_initialized"], False):
         st.session_state[FIELD_KEYS["theme"]] = "Claro"
         st.session_state[FIELD_KEYS["theme_initialized"]] = True
 
-    for k, v in defaults.items():
-        if k not in st.session_state:
-            st.session_state[k] = v
+    # get_defaults() (incluye la fecha con zona horaria) solo si falta alguna key,
+    # no en cada rerun.
+    missing = [k for k in FIELD_KEYS.values() if k not in st.session_state]
+    if missing:
+        defaults = get_defaults()
+        for k in missing:
+            st.session_state[k] = defaults[k]
 
 
 def hard_reset_now():
@@ -121,18 +170,13 @@ def hard_reset_now():
     """
     current_theme = st.session_state.get(FIELD_KEYS["theme"], "Claro")
 
-    for key in list(st.session_state.keys()):
-        del st.session_state[key]
-
-    st.session_state[UP_NONCE] = 1
-
-    defaults = get_defaults()
-    for k, v in defaults.items():
-        st.session_state[k] = v
+    # Solo se sobrescriben nuestras keys. Los uploaders se vacían al cambiar el nonce
+    # (key nueva); Streamlit descarta solo el estado de los widgets que ya no se dibujan.
+    st.session_state.update(get_defaults())
+    st.session_state[UP_NONCE] = st.session_state.get(UP_NONCE, 0) + 1
 
     st.session_state[FIELD_KEYS["theme"]] = current_theme
     st.session_state[FIELD_KEYS["theme_initialized"]] = True  # no volver a forzar
-    st.rerun()
 
 
 init_state()
@@ -141,38 +185,44 @@ init_state()
 # -----------------------------
 # CSS Dinámico
 # -----------------------------
-def apply_theme_css(theme: str) -> None:
-    if theme == "Oscuro":
-        bg = "#070B14"
-        fg = "#FFFFFF"
-        muted = "#D6DEEA"
-        card = "#0B1220"
-        border = "#2A3A58"
-        input_bg = "#0A1020"
-        placeholder = "#9FB0C8"
-        focus = "#5AA9FF"
-
-        btn_bg = "#0B1220"
-        btn_border = "#2A3A58"
-        btn_text = "#FFFFFF"
-        btn_hover = "#101A2E"
-    else:
-        bg = "#FFFFFF"
-        fg = "#0F172A"
-        muted = "#334155"
-        card = "#F8FAFC"
-        border = "#E2E8F0"
-        input_bg = "#FFFFFF"
-        placeholder = "#64748B"
-        focus = "#2563EB"
-
-        btn_bg = "#FFFFFF"
-        btn_border = "#CBD5E1"
-        btn_text = "#0F172A"
-        btn_hover = "#F1F5F9"
-
-    st.markdown(
-        f"""
+THEME_COLORS = {
+    "Oscuro": {
+        "bg": "#070B14",
+        "fg": "#FFFFFF",
+        "muted": "#D6DEEA",
+        "card": "#0B1220",
+        "border": "#2A3A58",
+        "input_bg": "#0A1020",
+        "placeholder": "#9FB0C8",
+        "focus": "#5AA9FF",
+
+        "btn_bg": "#0B1220",
+        "btn_border": "#2A3A58",
+        "btn_text": "#FFFFFF",
+        "btn_hover": "#101A2E",
+    },
+    "Claro": {
+        "bg": "#FFFFFF",
+        "fg": "#0F172A",
+        "muted": "#334155",
+        "card": "#F8FAFC",
+        "border": "#E2E8F0",
+        "input_bg": "#FFFFFF",
+        "placeholder": "#64748B",
+        "focus": "#2563EB",
+
+        "btn_bg": "#FFFFFF",
+        "btn_border": "#CBD5E1",
+        "btn_text": "#0F172A",
+        "btn_hover": "#F1F5F9",
+    },
+}
+
+
+def theme_css(theme: str) -> str:
+    # Sin st.cache_data: el hash + unpickle del cache cuesta más que este format()
+    palette = THEME_COLORS["Oscuro" if theme == "Oscuro" else "Claro"]
+    return """
         <style>
         .stApp {{ background: {bg}; color: {fg}; }}
         div[data-testid="stMarkdownContainer"] * {{ color: {fg} !important; }}
@@ -263,19 +313,30 @@ def apply_theme_css(theme: str) -> None:
 
         div[role="radiogroup"] * {{ color: {fg} !important; }}
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """.format(**palette)
+
+
+def apply_theme_css(theme: str) -> None:
+    # Se emite en cada run: Streamlit quita del DOM los elementos que no se re-emiten.
+    st.markdown(theme_css(theme), unsafe_allow_html=True)
 
 
 # -----------------------------
 # Corrección técnica (A)
 # -----------------------------
+# Solo tramos que realmente cambian (un espacio simple no es match ni se reescribe)
+_SPACES_RE = re.compile(r"\t[ \t]*| [ \t]+")
+_BLANKS_RE = re.compile(r"\n{3,}")
+
+
 def normalize_spaces(text: str) -> str:
     text = text or ""
+    # Texto ya limpio (lo habitual): búsquedas de subcadena en C, sin regex
+    if "\r" not in text and "\t" not in text and "  " not in text and "\n\n\n" not in text:
+        return text.strip()
     text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _SPACES_RE.sub(" ", text)
+    text = _BLANKS_RE.sub("\n\n", text)
     return text.strip()
 
 
@@ -329,6 +390,30 @@ TECH_WORDS = {
 # Pre-cálculo: key sin acentos -> palabra correcta
 TECH_MAP = {strip_accents(k).lower(): v for k, v in TECH_WORDS.items()}
 
+# Letras que forman palabra (no números), incluyendo tildes
+_WORD_CHARS = "A-Za-zÁÉÍÓÚÜÑáéíóúüñ"
+_LETTER_VARIANTS = {"a": "aá", "e": "eé", "i": "ií", "o": "oó", "u": "uúü", "n": "nñ"}
+
+
+def _variant_class(ch: str) -> str:
+    # "a" -> "[aáAÁ]": cualquier tilde y mayúscula/minúscula de esa letra
+    low = _LETTER_VARIANTS.get(ch, ch)
+    return "[" + low + low.upper() + "]"
+
+
+# Los matches solo pueden traer estas tildes (ver _LETTER_VARIANTS): tabla en C en vez
+# de NFD + unicodedata.category por carácter. strip_accents queda para armar TECH_MAP.
+_ACCENT_TABLE = str.maketrans("áéíóúüñÁÉÍÓÚÜÑ", "aeiouunAEIOUUN")
+
+
+# Una sola alternancia con todas las palabras del diccionario: el texto se recorre
+# una vez y el callback solo corre sobre candidatos (no sobre cada palabra).
+_TECH_RE = re.compile(
+    rf"(?<![{_WORD_CHARS}])(?:"
+    + "|".join("".join(_variant_class(ch) for ch in k) for k in sorted(TECH_MAP, key=len, reverse=True))
+    + rf")(?![{_WORD_CHARS}])"
+)
+
 
 def technical_spanish_fixes(text: str):
     """
@@ -341,9 +426,6 @@ def technical_spanish_fixes(text: str):
     t = normalize_spaces(text or "")
     changes_counter = Counter()
 
-    # Tokenizador: solo palabras (no números), incluyendo letras con tildes
-    word_re = re.compile(r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+")
-
     def repl(m: re.Match) -> str:
         w = m.group(0)
 
@@ -351,7 +433,7 @@ def technical_spanish_fixes(text: str):
         if any(ch.isdigit() for ch in w):
             return w
 
-        key = strip_accents(w).lower()
+        key = w.translate(_ACCENT_TABLE).lower()
 
         if key in TECH_MAP:
             new_word = match_case(w, TECH_MAP[key])
@@ -361,7 +443,7 @@ def technical_spanish_fixes(text: str):
 
         return w
 
-    t2 = word_re.sub(repl, t)
+    t2 = _TECH_RE.sub(repl, t)
 
     # Capitalización inicial (sin tocar el resto)
     logs = []
@@ -377,145 +459,240 @@ def technical_spanish_fixes(text: str):
 
 def apply_obs_fix():
     st.session_state[FIELD_KEYS["observaciones_raw"]] = st.session_state.get(FIELD_KEYS["obs_fixed_preview"], "")
-    st.rerun()
 
 
 # -----------------------------
 # Auto-conclusión (corta)
 # -----------------------------
-def generate_conclusion_short(disciplina: str, nivel_riesgo: str, hallazgos: List[str]) -> str:
+def generate_conclusion_short(disciplina: str, nivel_riesgo: str, hallazgos: Sequence[str]) -> str:
     riesgo = f"Riesgo {nivel_riesgo.lower()}"
     prioridad = "inmediata" if nivel_riesgo == "Alto" else "programada" if nivel_riesgo == "Medio" else "rutinaria"
     hall = ", ".join(hallazgos) if hallazgos else "General"
     return f"{disciplina}: {riesgo}. Prioridad {prioridad}. Hallazgos: {hall}. Acción: corregir según prioridad."
 
 
-def compute_auto_hash() -> str:
-    d = st.session_state.get(FIELD_KEYS["disciplina"], "")
-    r = st.session_state.get(FIELD_KEYS["nivel_riesgo"], "")
-    h = ",".join(st.session_state.get(FIELD_KEYS["hallazgos"], []) or [])
-    return f"{d}|{r}|{h}"
+def compute_auto_hash() -> tuple:
+    # Tupla de entradas: se compara por igualdad, sin armar strings intermedios
+    ss = st.session_state
+    return (
+        ss.get(FIELD_KEYS["disciplina"], ""),
+        ss.get(FIELD_KEYS["nivel_riesgo"], ""),
+        tuple(ss.get(FIELD_KEYS["hallazgos"], []) or ()),
+    )
 
 
 def sync_auto_conclusion_if_needed():
-    if not st.session_state.get(FIELD_KEYS["auto_conclusion"], True):
+    ss = st.session_state
+    if not ss.get(FIELD_KEYS["auto_conclusion"], True):
         return
-    if st.session_state.get(FIELD_KEYS["conclusion_locked"], False):
+    if ss.get(FIELD_KEYS["conclusion_locked"], False):
         return
 
     current_hash = compute_auto_hash()
-    last_hash = st.session_state.get(FIELD_KEYS["last_auto_hash"], "")
+    if current_hash == ss.get(FIELD_KEYS["last_auto_hash"]) and ss.get(FIELD_KEYS["conclusion"], "").strip():
+        return
+
+    disciplina, nivel_riesgo, hallazgos = current_hash
+    ss[FIELD_KEYS["conclusion"]] = generate_conclusion_short(
+        disciplina or "Otra",
+        nivel_riesgo or "Medio",
+        hallazgos,
+    )
+    ss[FIELD_KEYS["last_auto_hash"]] = current_hash
 
-    if current_hash != last_hash or not (st.session_state.get(FIELD_KEYS["conclusion"], "").strip()):
-        st.session_state[FIELD_KEYS["conclusion"]] = generate_conclusion_short(
-            st.session_state.get(FIELD_KEYS["disciplina"], "Otra"),
-            st.session_state.get(FIELD_KEYS["nivel_riesgo"], "Medio"),
-            st.session_state.get(FIELD_KEYS["hallazgos"], []),
-        )
-        st.session_state[FIELD_KEYS["last_auto_hash"]] = current_hash
+
+# Callbacks (on_click): corren antes del rerun que ya provoca el click, sin st.rerun() extra
+def set_conclusion_auto():
+    st.session_state[FIELD_KEYS["conclusion_locked"]] = False
+    st.session_state[FIELD_KEYS["last_auto_hash"]] = None  # fuerza regenerar en este run
+
+
+def set_conclusion_manual():
+    st.session_state[FIELD_KEYS["conclusion_locked"]] = True
 
 
 # -----------------------------
 # Imágenes (COVER)
 # -----------------------------
-def _img_cover(file_bytes: bytes, w_mm: float, h_mm: float) -> io.BytesIO:
-    img = ImageOps.exif_transpose(Image.open(io.BytesIO(file_bytes)).convert("RGB"))
-    box_px_w = 1500
-    box_px_h = max(1, int(box_px_w * (h_mm / w_mm)))
-
-    scale = max(box_px_w / img.width, box_px_h / img.height)
-    img = img.resize((int(img.width * scale), int(img.height * scale)), Image.Resampling.LANCZOS)
-
-    left = (img.width - box_px_w) // 2
-    top = (img.height - box_px_h) // 2
-    img = img.crop((left, top, left + box_px_w, top + box_px_h))
+PDF_IMAGE_DPI = 200  # suficiente para impresión A4; subir si se necesita más detalle
+RESAMPLE = Image.Resampling.BICUBIC
+ASPECT_TOLERANCE = 0.01  # 1% de deformación no se nota impreso
+# Tope de píxeles a decodificar, medido después de draft(): un JPEG de teléfono baja a
+# 1/2..1/8 y pasa; un PNG de 100 MP (~400 MB en RGB) se rechaza antes de reservar memoria.
+MAX_DECODE_PIXELS = 40_000_000
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _img_cover(file_bytes: bytes, w_mm: float, h_mm: float, quality: int = 82) -> bytes:
+    # Resolución según el tamaño físico en el PDF (no un ancho fijo)
+    box_px_w = max(1, round(w_mm * PDF_IMAGE_DPI / 25.4))
+    box_px_h = max(1, round(h_mm * PDF_IMAGE_DPI / 25.4))
+
+    img = Image.open(io.BytesIO(file_bytes))
+    src_w, src_h = img.size
+    target_aspect = box_px_w / box_px_h
+
+    # JPEG: decodifica ya reducido (escala DCT 1/2, 1/4, 1/8) sin bajar del box.
+    # Se pide un cuadrado con el lado mayor para cubrir fotos rotadas por EXIF.
+    side = max(box_px_w, box_px_h)
+    img.draft("RGB", (side, side))
+    # open() es perezoso: hasta aquí solo se leyó la cabecera. El tope va antes de
+    # getexif(), que en un PNG sin chunk eXIf en la cabecera llama a load().
+    if img.width * img.height > MAX_DECODE_PIXELS:
+        raise Image.DecompressionBombError(
+            f"{img.width}x{img.height} px supera el tope de {MAX_DECODE_PIXELS} px a decodificar"
+        )
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+
+    # JPEG que ya cabe en el recuadro con su misma proporción: se embebe tal cual
+    # (ReportLab lo escala al tamaño final), sin decode ni re-encode. Solo baseline y
+    # sin más segmentos que APP0/JFIF: EXIF (GPS, cámara, miniatura), XMP, ICC o COM
+    # irían tal cual al informe; el re-encode de abajo los descarta.
+    if (
+        img.format == "JPEG"
+        and not img.info.get("progressive")
+        and all(marker == "APP0" for marker, _ in img.applist)
+        and img.mode in ("RGB", "L")
+        and orientation == 1
+        and src_w <= box_px_w
+        and src_h <= box_px_h
+        and abs(src_w / src_h - target_aspect) <= ASPECT_TOLERANCE * target_aspect
+    ):
+        return file_bytes
+
+    if img.mode not in ("RGB", "L"):
+        # JPEG ya viene en RGB/L: convertir solo PNG con alfa, paleta, CMYK, etc.
+        img = img.convert("RGB")
+    if orientation != 1:
+        # exif_transpose copia la imagen aunque no haya rotación: solo si hace falta
+        img = ImageOps.exif_transpose(img)
+
+    # Recorte centrado en coordenadas de origen + resize en una sola pasada
+    # (sin imagen intermedia sobredimensionada ni crop aparte).
+    if img.width / img.height > target_aspect:
+        crop_w = img.height * target_aspect
+        src_box = ((img.width - crop_w) / 2, 0, (img.width + crop_w) / 2, img.height)
+    else:
+        crop_h = img.width / target_aspect
+        src_box = (0, (img.height - crop_h) / 2, img.width, (img.height + crop_h) / 2)
+    img = img.resize((box_px_w, box_px_h), RESAMPLE, box=src_box, reducing_gap=2.0)
 
     buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=90)
-    buf.seek(0)
-    return buf
+    # 4:2:0 y sin pasada extra de Huffman: suficiente para fotos impresas a pocos cm
+    img.save(buf, format="JPEG", quality=quality, subsampling=2, optimize=False, progressive=False)
+    return buf.getvalue()
 
 
 # -----------------------------
 # PDF
 # -----------------------------
+@st.cache_resource(show_spinner=False)
+def get_pdf_styles() -> dict:
+    # Streamlit re-ejecuta el script en cada rerun: se construye una vez por proceso.
+    sample = getSampleStyleSheet()
+    return {
+        "h1": sample["Heading1"],
+        "h2": sample["Heading2"],
+        "body": sample["BodyText"],
+        "data_table": TableStyle(
+            [
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                ("BACKGROUND", (0, 0), (0, -1), colors.whitesmoke),
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ]
+        ),
+        "img_table": TableStyle(
+            [
+                ("LEFTPADDING", (0, 0), (-1, -1), 0),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 4),
+                ("TOPPADDING", (0, 0), (-1, -1), 4),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+            ]
+        ),
+    }
+
+
+def text_to_paragraph_html(text: str) -> str:
+    # Texto plano -> marcado mínimo de Paragraph (escapado + saltos de línea)
+    return escape(text or "").replace("\n", "<br/>")
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
 def build_pdf(
-    data_dict: dict,
-    fotos: List[Tuple[str, bytes]],
+    form: FormState,
+    fotos: Tuple[Tuple[str, bytes], ...],
     firma_img: Optional[Tuple[str, bytes]],
 ) -> bytes:
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, margin=15 * mm)
-    styles = getSampleStyleSheet()
+    styles = get_pdf_styles()
 
     story = [
-        Paragraph("INFORME TÉCNICO DE INSPECCIÓN", styles["Heading1"]),
+        Paragraph("INFORME TÉCNICO DE INSPECCIÓN", styles["h1"]),
         Spacer(1, 8),
     ]
 
     table_data = [
-        ["Fecha", data_dict["fecha"]],
-        ["Título", data_dict["titulo"]],
-        ["Disciplina", data_dict["disciplina"]],
-        ["Riesgo", data_dict["nivel_riesgo"]],
-        ["Equipo/Área", data_dict["equipo"] or "—"],
-        ["Ubicación", data_dict["ubicacion"] or "—"],
-        ["Inspector", data_dict["inspector"]],
-        ["Cargo", data_dict["cargo"]],
-        ["OT/Registro", data_dict["registro_ot"] or "—"],
+        ["Fecha", form.fecha],
+        ["Título", form.titulo],
+        ["Disciplina", form.disciplina],
+        ["Riesgo", form.nivel_riesgo],
+        ["Equipo/Área", form.equipo or "—"],
+        ["Ubicación", form.ubicacion or "—"],
+        ["Inspector", form.inspector],
+        ["Cargo", form.cargo],
+        ["OT/Registro", form.registro_ot or "—"],
     ]
 
     t = Table(table_data, colWidths=[42 * mm, 138 * mm])
-    t.setStyle(
-        TableStyle(
-            [
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                ("BACKGROUND", (0, 0), (0, -1), colors.whitesmoke),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-            ]
-        )
-    )
+    t.setStyle(styles["data_table"])
     story.extend([t, Spacer(1, 10)])
 
-    story.append(Paragraph("Observaciones", styles["Heading2"]))
-    story.append(Paragraph(escape(data_dict["observaciones"]).replace("\n", "<br/>"), styles["BodyText"]))
+    story.append(Paragraph("Observaciones", styles["h2"]))
+    story.append(Paragraph(text_to_paragraph_html(form.observaciones), styles["body"]))
     story.append(Spacer(1, 8))
 
-    story.append(Paragraph("Conclusión", styles["Heading2"]))
-    story.append(Paragraph(escape(data_dict["conclusion"]).replace("\n", "<br/>"), styles["BodyText"]))
+    story.append(Paragraph("Conclusión", styles["h2"]))
+    story.append(Paragraph(text_to_paragraph_html(form.conclusion), styles["body"]))
     story.append(Spacer(1, 8))
 
-    # Imágenes: 1 fila horizontal (máx 15x6 cm)
-    if fotos:
-        story.append(Paragraph("Imágenes", styles["Heading2"]))
-        use = fotos[:3]
-        n = len(use)
+    # Fotos + firma: decode/resize/encode en paralelo (Pillow libera el GIL)
+    use = fotos[:3]
+    n = len(use)
+    img_w_mm = TOTAL_IMG_W_MM / n if n else TOTAL_IMG_W_MM
+    img_h_mm = TOTAL_IMG_H_MM
+
+    foto_jpegs: List[bytes] = []
+    sig_jpeg: Optional[bytes] = None
+    if use or firma_img:
+        with ThreadPoolExecutor(max_workers=n + 1) as ex:
+            # Misma foto subida dos veces: un solo job. cache_data ya calcula una sola vez
+            # (lock por key); esto evita un worker bloqueado esperando ese resultado.
+            foto_jobs = {}
+            for _, b in use:
+                if b not in foto_jobs:
+                    foto_jobs[b] = ex.submit(_img_cover, b, img_w_mm, img_h_mm)
+            sig_job = ex.submit(_img_cover, firma_img[1], SIGN_W_MM, SIGN_H_MM, SIGN_JPEG_QUALITY) if firma_img else None
+            foto_jpegs = [foto_jobs[b].result() for _, b in use]
+            sig_jpeg = sig_job.result() if sig_job else None
 
-        img_w_mm = TOTAL_IMG_W_MM / n
-        img_h_mm = TOTAL_IMG_H_MM
+    # Imágenes: 1 fila horizontal (máx 15x6 cm)
+    if foto_jpegs:
+        story.append(Paragraph("Imágenes", styles["h2"]))
 
         imgs = [
-            RLImage(_img_cover(b, img_w_mm, img_h_mm), width=img_w_mm * mm, height=img_h_mm * mm)
-            for _, b in use
+            RLImage(io.BytesIO(jpeg), width=img_w_mm * mm, height=img_h_mm * mm)
+            for jpeg in foto_jpegs
         ]
 
         img_table = Table([imgs], colWidths=[img_w_mm * mm] * n)
-        img_table.setStyle(
-            TableStyle(
-                [
-                    ("LEFTPADDING", (0, 0), (-1, -1), 0),
-                    ("RIGHTPADDING", (0, 0), (-1, -1), 4),
-                    ("TOPPADDING", (0, 0), (-1, -1), 4),
-                    ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-                ]
-            )
-        )
+        img_table.setStyle(styles["img_table"])
         story.append(img_table)
 
     # Firma: 3x3 cm (al final)
-    if firma_img:
+    if sig_jpeg:
         story.append(Spacer(1, 8))
-        sig = RLImage(_img_cover(firma_img[1], SIGN_W_MM, SIGN_H_MM), width=SIGN_W_MM * mm, height=SIGN_H_MM * mm)
+        sig = RLImage(io.BytesIO(sig_jpeg), width=SIGN_W_MM * mm, height=SIGN_H_MM * mm)
         story.append(sig)
 
     doc.build(story)
@@ -529,8 +706,9 @@ apply_theme_css(st.session_state[FIELD_KEYS["theme"]])
 
 st.markdown(f"<h1><i>{APP_TITLE}</i></h1><p class='muted'>{APP_SUBTITLE}</p>", unsafe_allow_html=True)
 
+# Sin segundo apply_theme_css: el cambio de tema ya llega en session_state al
+# inicio del rerun que provoca el radio.
 st.radio("Tema", ["Claro", "Oscuro"], horizontal=True, key=FIELD_KEYS["theme"])
-apply_theme_css(st.session_state[FIELD_KEYS["theme"]])
 
 # Configuración + Limpieza
 st.markdown("<div class='app-card'>", unsafe_allow_html=True)
@@ -542,8 +720,8 @@ with c2:
 with c3:
     st.checkbox("Corrección", key=FIELD_KEYS["show_correccion"])
 with c4:
-    if st.button("Limpiar formulario", use_container_width=True):
-        hard_reset_now()
+    # on_click: el reset corre antes de instanciar los widgets del próximo run
+    st.button("Limpiar formulario", use_container_width=True, on_click=hard_reset_now)
 st.markdown("</div>", unsafe_allow_html=True)
 
 # Formulario
@@ -592,15 +770,9 @@ sync_auto_conclusion_if_needed()
 
 cX, cY = st.columns(2)
 with cX:
-    if st.button("🔁 Auto", use_container_width=True):
-        st.session_state[FIELD_KEYS["conclusion_locked"]] = False
-        st.session_state[FIELD_KEYS["last_auto_hash"]] = ""
-        sync_auto_conclusion_if_needed()
-        st.rerun()
+    st.button("🔁 Auto", use_container_width=True, on_click=set_conclusion_auto)
 with cY:
-    if st.button("✍️ Manual", use_container_width=True):
-        st.session_state[FIELD_KEYS["conclusion_locked"]] = True
-        st.rerun()
+    st.button("✍️ Manual", use_container_width=True, on_click=set_conclusion_manual)
 
 st.text_area("Conclusión", height=120, key=FIELD_KEYS["conclusion"])
 st.markdown("</div>", unsafe_allow_html=True)
@@ -624,29 +796,23 @@ st.markdown("</div>", unsafe_allow_html=True)
 
 # Generación
 if st.button("Generar PDF Profesional ✅", use_container_width=True):
-    fotos = [(f.name, f.read()) for f in (fotos_files or [])[:3]]
-    firma = (firma_file.name, firma_file.read()) if firma_file else None
-
-    datos = {
-        "titulo": st.session_state[FIELD_KEYS["titulo"]],
-        "fecha": st.session_state[FIELD_KEYS["fecha"]],
-        "disciplina": st.session_state[FIELD_KEYS["disciplina"]],
-        "equipo": st.session_state[FIELD_KEYS["equipo"]],
-        "ubicacion": st.session_state[FIELD_KEYS["ubicacion"]],
-        "inspector": st.session_state[FIELD_KEYS["inspector"]],
-        "cargo": st.session_state[FIELD_KEYS["cargo"]],
-        "registro_ot": st.session_state[FIELD_KEYS["registro_ot"]],
-        "nivel_riesgo": st.session_state[FIELD_KEYS["nivel_riesgo"]],
-        "observaciones": st.session_state[FIELD_KEYS["observaciones_raw"]],
-        "conclusion": st.session_state[FIELD_KEYS["conclusion"]],
-    }
-
-    pdf_output = build_pdf(datos, fotos, firma)
-
-    st.download_button(
-        "Descargar Informe",
-        data=pdf_output,
-        file_name=f"informe_{datetime.now(TZ_CL).strftime('%H%M%S')}.pdf",
-        mime="application/pdf",
-        use_container_width=True,
-    )
+    # getvalue() devuelve el buffer del UploadedFile sin copiarlo ni depender de la posición
+    fotos = tuple((f.name, f.getvalue()) for f in islice(fotos_files or (), 3))
+    firma = (firma_file.name, firma_file.getvalue()) if firma_file else None
+
+    ss = st.session_state
+    datos = FormState(**{name: ss[key] for name, key in PDF_FIELD_KEYS.items()})
+
+    # build_pdf está cacheado: mismos datos + mismos archivos -> mismos bytes sin reconstruir
+    try:
+        pdf_output = build_pdf(datos, fotos, firma)
+    except Image.DecompressionBombError:
+        st.error("Una imagen es demasiado grande para procesar (máx. ~40 MP). Redúzcala y vuelva a generar.")
+    else:
+        st.download_button(
+            "Descargar Informe",
+            data=pdf_output,
+            file_name=f"informe_{datetime.now(TZ_CL).strftime('%H%M%S')}.pdf",
+            mime="application/pdf",
+            use_container_width=True,
+        )